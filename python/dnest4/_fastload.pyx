@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+
+cimport cython
+from libc.stdlib cimport strtod
+
+import numpy as np
+cimport numpy as np
+np.import_array()
+
+
+@cython.boundscheck(False)
+def parse_row(bytes line, np.ndarray[np.float64_t, ndim=1] out):
+    """
+    Parse whitespace-separated numbers from ``line`` into ``out``,
+    stopping at the first token that isn't a number or when ``out`` is
+    full. Returns the number of values written.
+    """
+    cdef const char* p = line
+    cdef char* end
+    cdef double value
+    cdef Py_ssize_t n = 0
+    cdef Py_ssize_t size = out.shape[0]
+
+    while n < size:
+        value = strtod(p, &end)
+        if end == p:
+            break
+        out[n] = value
+        n += 1
+        p = end
+    return n
@@ -1,169 +1,240 @@
-from collections import OrderedDict
 from enum import Enum
+from string import Template
+from textwrap import indent
+import functools
+import re
+import sys
 import numpy as np
 
 __all__ = ["Uniform", "LogUniform", "Normal", "Cauchy", "Poisson",\
            "Exponential", "Binomial",\
            "Deterministic", "NodeType", "Node", "Model"]
 
+def _parameter_str(value):
+    """
+    Format a prior parameter for insertion into generated code. repr is
+    used for floats so the literal round-trips at full precision.
+    """
+    if isinstance(value, float):
+        return repr(float(value))
+    return str(value)
+
 class Uniform:
     """
     Uniform distributions.
     """
+    # Templates are compiled once at import time and substituted in a
+    # single pass, rather than re-scanned once per parameter.
+    _from_prior_template = Template("{x} = $a + ($b - ($a))*rng.rand();\n")
+    _perturb_template = Template("{x} += ($b - ($a))*rng.randh();\n"
+                                 "wrap({x}, $a, $b);\n")
+    _log_prob_template = Template("if({x} < ($a) || {x} > ($b))\n"
+                                  "    logp = -numeric_limits<double>::max();\n"
+                                  "logp += -log($b - ($a));\n")
+
     def __init__(self, a, b):
         self.a, self.b = a, b
+        self._a_str, self._b_str = _parameter_str(a), _parameter_str(b)
+        self._rendered = {}
 
     def from_prior(self):
-        s = "{x} = {a} + ({b} - ({a}))*rng.rand();\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._from_prior_template)
 
     def perturb(self):
-        s  = "{x} += ({b} - ({a}))*rng.randh();\n"
-        s += "wrap({x}, {a}, {b});\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._perturb_template)
 
     def log_prob(self):
-        s  = "if({x} < ({a}) || {x} > ({b}))\n"
-        s += "    logp = -numeric_limits<double>::max();\n"
-        s += "logp += -log({b} - ({a}));\n"
-        return self.insert_parameters(s)
-
-    def insert_parameters(self, s):
-        s = s.replace("{a}", str(self.a))
-        s = s.replace("{b}", str(self.b))
-        return s
+        return self.insert_parameters(self._log_prob_template)
+
+    def insert_parameters(self, template):
+        # The parameters never change, so each template only needs to be
+        # rendered once per instance.
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(a=self._a_str, b=self._b_str)
+            self._rendered[template] = s
+            return s
 
 class LogUniform:
     """
     Log-uniform distributions.
     """
+    _from_prior_template = Template(
+            "{x} = exp(log($a) + log(($b)/($a))*rng.rand());\n")
+    _perturb_template = Template(
+            "{x} = log({x});\n"
+            "{x} += log(($b)/($a))*rng.randh();\n"
+            "wrap({x}, log($a), log($b));\n"
+            "{x} = exp({x});\n")
+    _log_prob_template = Template(
+            "if({x} < ($a) || {x} > ($b))\n"
+            "    logp = -numeric_limits<double>::max();\n"
+            "logp += -log({x}) - log(($b)/($a));\n")
+
     def __init__(self, a, b):
         self.a, self.b = a, b
+        self._a_str, self._b_str = _parameter_str(a), _parameter_str(b)
+        self._rendered = {}
 
     def from_prior(self):
-        s = "{x} = exp(log({a}) + log(({b})/({a}))*rng.rand());\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._from_prior_template)
 
     def perturb(self):
-        s  = "{x} = log({x});\n"
-        s += "{x} += log(({b})/({a}))*rng.randh();\n"
-        s += "wrap({x}, log({a}), log({b}));\n"
-        s += "{x} = exp({x});\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._perturb_template)
 
     def log_prob(self):
-        s  = "if({x} < ({a}) || {x} > ({b}))\n"
-        s += "    logp = -numeric_limits<double>::max();\n"
-        s += "logp += -log({x}) - log(({b})/({a}));\n"
-        return self.insert_parameters(s)
-
-    def insert_parameters(self, s):
-        s = s.replace("{a}", str(self.a))
-        s = s.replace("{b}", str(self.b))
-        return s
+        return self.insert_parameters(self._log_prob_template)
+
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(a=self._a_str, b=self._b_str)
+            self._rendered[template] = s
+            return s
 
 class Normal:
     """
     Normal distributions.
     """
+    _from_prior_template = Template("{x} = $mu + ($sigma)*rng.randn();\n")
+    # The standardised residual is computed once into a local, and
+    # _z*_z is a single multiply where pow(_, 2) might not be.
+    _perturb_template = Template(
+            "{ double _z = (({x}) - ($mu))/($sigma); log_H -= -0.5*_z*_z; }\n"
+            "{x} += ($sigma)*rng.randh();\n"
+            "{ double _z = (({x}) - ($mu))/($sigma); log_H += -0.5*_z*_z; }\n")
+    _log_prob_template = Template(
+            "logp += -0.5*log(2*M_PI) - log($sigma) "
+            "- 0.5*pow((({x}) - ($mu))/($sigma), 2);\n")
+
     def __init__(self, mu, sigma):
         self.mu, self.sigma = mu, sigma
+        self._mu_str = _parameter_str(mu)
+        self._sigma_str = _parameter_str(sigma)
+        self._rendered = {}
 
     def from_prior(self):
-        s = "{x} = {mu} + ({sigma})*rng.randn();\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._from_prior_template)
 
     def perturb(self):
-        s  = "log_H -= -0.5*pow((({x}) - ({mu}))/({sigma}), 2);\n"
-        s += "{x} += ({sigma})*rng.randh();\n"
-        s += "log_H += -0.5*pow((({x}) - ({mu}))/({sigma}), 2);\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._perturb_template)
 
     def log_prob(self):
-        s  = "logp += -0.5*log(2*M_PI) - log({sigma}) "
-        s += "- 0.5*pow((({x}) - ({mu}))/({sigma}), 2);\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._log_prob_template)
 
-    def insert_parameters(self, s):
-        s = s.replace("{mu}", str(self.mu))
-        s = s.replace("{sigma}", str(self.sigma))
-        return s
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(mu=self._mu_str, sigma=self._sigma_str)
+            self._rendered[template] = s
+            return s
 
 
 class Cauchy:
     """
     Cauchy distributions.
     """
+    _from_prior_template = Template(
+            "{x} = $mu + ($sigma)*tan(M_PI*(rng.rand() - 0.5));\n")
+    _perturb_template = Template(
+            "{x} = 0.5 + atan(({x} - ($mu))/($sigma))/M_PI;\n"
+            "{x} += rng.randh();\n"
+            "wrap({x}, 0.0, 1.0);\n"
+            "{x} = $mu + ($sigma)*tan(M_PI*({x} - 0.5));\n")
+    _log_prob_template = Template(
+            "logp += -log(M_PI) - log($sigma) "
+            "- log(1.0 + pow(({x} - ($mu))/($sigma), 2));\n")
+
     def __init__(self, mu, sigma):
         self.mu, self.sigma = mu, sigma
+        self._mu_str = _parameter_str(mu)
+        self._sigma_str = _parameter_str(sigma)
+        self._rendered = {}
 
     def from_prior(self):
-        s = "{x} = {mu} + ({sigma})*tan(M_PI*(rng.rand() - 0.5));\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._from_prior_template)
 
     def perturb(self):
-        s  = "{x} = 0.5 + atan(({x} - ({mu}))/({sigma}))/M_PI;\n"
-        s += "{x} += rng.randh();\n"
-        s += "wrap({x}, 0.0, 1.0);\n"
-        s += "{x} = {mu} + ({sigma})*tan(M_PI*({x} - 0.5));\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._perturb_template)
 
     def log_prob(self):
-        s  = "logp += -log(M_PI) - log({sigma}) "
-        s += "- log(1.0 + pow(({x} - ({mu}))/({sigma}), 2));\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._log_prob_template)
 
-    def insert_parameters(self, s):
-        s = s.replace("{mu}", str(self.mu))
-        s = s.replace("{sigma}", str(self.sigma))
-        return s
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(mu=self._mu_str, sigma=self._sigma_str)
+            self._rendered[template] = s
+            return s
 
 class Exponential:
     """
     Exponential distributions.
     """
+    _from_prior_template = Template(
+            "{x} = -($mu)*log(1.0 - rng.rand());\n")
+    _perturb_template = Template(
+            "{x} = 1.0 - exp(-{x}/($mu));\n"
+            "{x} += rng.randh();\n"
+            "wrap({x}, 0.0, 1.0);\n"
+            "{x} = -($mu)*log(1.0 - {x});\n")
+    _log_prob_template = Template(
+            "if({x} < 0.0)\n"
+            "    logp = -numeric_limits<double>::max();\n"
+            "logp += -log($mu) - {x}/($mu);\n")
+
     def __init__(self, mu):
         self.mu = mu
+        self._mu_str = _parameter_str(mu)
+        self._rendered = {}
 
     def from_prior(self):
-        s = "{x} = -({mu})*log(1.0 - rng.rand());\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._from_prior_template)
 
     def perturb(self):
-        s  = "{x} = 1.0 - exp(-{x}/({mu}));\n"
-        s += "{x} += rng.randh();\n"
-        s += "wrap({x}, 0.0, 1.0);\n"
-        s += "{x} = -({mu})*log(1.0 - {x}));\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._perturb_template)
 
     def log_prob(self):
-        s  = "if({x} < 0.0)\n"
-        s += "    logp = -numeric_limits<double>::max();\n"
-        s += "logp += -log({mu}) - {x}/({mu});\n"
-        return self.insert_parameters(s)
+        return self.insert_parameters(self._log_prob_template)
 
-    def insert_parameters(self, s):
-        s = s.replace("{mu}", str(self.mu))
-        return s
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(mu=self._mu_str)
+            self._rendered[template] = s
+            return s
 
 class Poisson:
     """
     Poisson distributions.
     SO FAR ONLY THE log_prob HAS BEEN IMPLEMENTED.
     """
+    _log_prob_template = Template(
+            "if({x} < 0)\n"
+            "    logp = -numeric_limits<double>::max();\n"
+            "else\n"
+            "    logp += {x}*log($mu) - ($mu) - lgamma({x} + 1);\n")
+
     def __init__(self, mu):
         self.mu = mu
+        self._mu_str = _parameter_str(mu)
+        self._rendered = {}
 
     def log_prob(self):
-        s  = "if({x} < 0)\n"
-        s += "    logp = -numeric_limits<double>::max();\n"
-        s += "else\n"
-        s += "    logp += {x}*log({mu}) - ({mu}) - lgamma({x} + 1);\n"
-        return self.insert_parameters(s)
-
-    def insert_parameters(self, s):
-        s = s.replace("{mu}", str(self.mu))
-        return s
+        return self.insert_parameters(self._log_prob_template)
+
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(mu=self._mu_str)
+            self._rendered[template] = s
+            return s
 
 
 class Binomial:
@@ -171,9 +242,22 @@ class Binomial:
     Binomial distributions.
     So far only the log_prob has been implemented.
     """
+    _log_prob_template = Template(
+            "if({x} < 0 || {x} > ($N))\n"
+            "    logp = -numeric_limits<double>::max();\n"
+            "else\n"
+            "{\n"
+            "    logp += lgamma($N + 1) - lgamma({x} + 1) - lgamma($N - ({x}) + 1)"
+            "- lgamma({x} + 1);\n"
+            "    logp += {x}*log($theta) + ($N - {x})*log(1.0 - ($theta));\n"
+            "}\n")
+
     def __init__(self, N, theta):
         self.N = N
         self.theta = theta
+        self._N_str = _parameter_str(N)
+        self._theta_str = _parameter_str(theta)
+        self._rendered = {}
 
     def from_prior(self):
         pass
@@ -182,36 +266,48 @@ class Binomial:
         pass
 
     def log_prob(self):
-        s  = "if({x} < 0 || {x} > ({N}))\n"
-        s += "    logp = -numeric_limits<double>::max();\n"
-        s += "else\n"
-        s += "{\n"
-        s += "    logp += lgamma({N} + 1) - lgamma({x} + 1) - lgamma({N} - ({x}) + 1)"
-        s += "- lgamma({x} + 1);\n"
-        s += "    logp += {x}*log({theta}) + ({N} - {x})*log(1.0 - ({theta}));\n"
-        s += "}\n"
-        return self.insert_parameters(s)
-
-    def insert_parameters(self, s):
-        s = s.replace("{N}", str(self.N))
-        s = s.replace("{theta}", str(self.theta))
-        return s
+        return self.insert_parameters(self._log_prob_template)
+
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(N=self._N_str, theta=self._theta_str)
+            self._rendered[template] = s
+            return s
 
 class Deterministic:
     """
     For deterministic nodes --- a delta-function distribution :)
     """
+    _from_prior_template = Template("{x} = $formula;\n")
+
     def __init__(self, formula):
         self.formula = formula
+        self._rendered = {}
 
     def from_prior(self):
-        s = "{x} = {formula};\n"
-        s = s.replace("{formula}", self.formula)
-        return s
+        return self.insert_parameters(self._from_prior_template)
 
     def perturb(self):
         return self.from_prior()
 
+    def insert_parameters(self, template):
+        try:
+            return self._rendered[template]
+        except KeyError:
+            s = template.substitute(formula=self.formula)
+            self._rendered[template] = s
+            return s
+
+@functools.lru_cache(maxsize=None)
+def _load_template(filename):
+    """
+    Read a code template file once and compile it for substitution.
+    """
+    with open(filename) as f:
+        return Template(f.read())
+
 class NodeType(Enum):
     """
     To distinguish between different kinds of Nodes
@@ -225,11 +321,16 @@ class Node:
     """
     A single parameter or data value.
     """
+    # Compiled once, so substituting the name into prior code is a single
+    # pass regardless of how many times {x} appears.
+    _x_pattern = re.compile(r"\{x\}")
+
     def __init__(self, dtype, name, prior, node_type, index=None):
         self.dtype = dtype
-        self.name  = name
         if index is not None:
-            self.name += "[" + str(index) + "]"
+            name = f"{name}[{index}]"
+        # Interned so the dict lookups in Model hash a cached key
+        self.name = sys.intern(name)
         self.index = index
         self.prior = prior
         self.node_type = node_type
@@ -237,130 +338,110 @@ class Node:
             assert self.prior == None
 
     def from_prior(self):
-        return self.prior.from_prior().replace("{x}", self.name)
+        return self._x_pattern.sub(self.name, self.prior.from_prior())
 
     def perturb(self):
-        return self.prior.perturb().replace("{x}", self.name)
+        return self._x_pattern.sub(self.name, self.prior.perturb())
 
     def log_prob(self):
-        return self.prior.log_prob().replace("{x}", self.name)
+        return self._x_pattern.sub(self.name, self.prior.log_prob())
 
     def __str__(self):
         return self.name
 
 class Model:
     def __init__(self):
-        self.nodes = OrderedDict()
+        self.nodes = {}
+
+        # Nodes partitioned by type, and names of vectors of each type,
+        # maintained by add_node so the code generators don't have to
+        # rescan self.nodes once per query.
+        self._by_type = {node_type: [] for node_type in NodeType}
+        self._vec_names = {node_type: set() for node_type in NodeType}
 
     def add_node(self, node):
         self.nodes[node.name] = node
+        self._by_type[node.node_type].append(node)
+        if node.index is not None:
+            self._vec_names[node.node_type].add(node.name.split("[")[0])
 
     def from_prior(self):
         """
         Generate the from_prior code for the whole model.
         """
-        s = ""
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.coordinate:
-                s += node.from_prior()
+        parts = []
+        for node in self._by_type[NodeType.coordinate]:
+            parts.append(node.from_prior())
 
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.derived:
-                s += node.from_prior()
-        return s
+        for node in self._by_type[NodeType.derived]:
+            parts.append(node.from_prior())
+        return "".join(parts)
 
     def perturb(self):
         """
         Generate perturb code for the whole model.
         """
-        # Count the number of coordinates
-        num_coords = 0
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.coordinate:
-                num_coords += 1
-
-        # Choose which one to perturb
-        s =  "double log_H = 0.0;\n"
-        s += "int which = rng.rand_int({n});\n".replace("{n}", str(num_coords))
-
-        # The if-statements
-        k = 0
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.coordinate:
-                s += "if(which == {k})\n{\n".replace("{k}", str(k))
-                s += "\n".join(["    " + x for x in node.perturb().splitlines()])
-                s += "\n}\n"
-                k += 1
+        coords = self._by_type[NodeType.coordinate]
+
+        # Choose which coordinate to perturb
+        parts = ["double log_H = 0.0;\n",
+                 f"int which = rng.rand_int({len(coords)});\n"]
+
+        # Dispatch on the chosen coordinate with a switch, which the
+        # compiler can turn into a jump table; the old if-chain tested
+        # every branch on every call
+        parts.append("switch(which)\n{\n")
+        for k, node in enumerate(coords):
+            parts.append(f"case {k}:\n{{\n")
+            parts.append(indent(node.perturb(), "    "))
+            parts.append("    break;\n}\n")
+        parts.append("}\n")
 
         # Recompute derived nodes
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.derived:
-                s += node.from_prior()
+        for node in self._by_type[NodeType.derived]:
+            parts.append(node.from_prior())
 
-        s += "return log_H;\n"
-        return s
+        parts.append("return log_H;\n")
+        return "".join(parts)
 
     def print_code(self):
         """
         Generate print code for the whole model.
         """
-        s = ""
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.coordinate:
-                s += "out<<" + str(node) + "<<\" \";\n"
-        return s
+        parts = []
+        for node in self._by_type[NodeType.coordinate]:
+            parts.append("out<<" + str(node) + "<<\" \";\n")
+        return "".join(parts)
 
     def description(self):
         """
         Generate description code for the whole model.
         """
-        s = "string s;\n"
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.coordinate:
-                s += "s += \"" + str(node) + ", \";\n"
-        s = s[0:-5]
-        s += "\";"
-        s += "\nreturn s;"
-        return s
+        joined = ", ".join(str(node)
+                           for node in self._by_type[NodeType.coordinate])
+        return f"string s = \"{joined}\";\nreturn s;"
 
     def log_likelihood(self):
         """
         Generate the log_likelihood code for the whole model.
         """
-        s = "double logp = 0.0;\n\n"
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == NodeType.data:
-                s += node.log_prob()
-        s += "\nreturn logp;"
-        return s
+        parts = ["double logp = 0.0;\n\n"]
+        for node in self._by_type[NodeType.data]:
+            parts.append(node.log_prob())
+        parts.append("\nreturn logp;")
+        return "".join(parts)
 
     def get_vector_names(self, node_type):
         """
         Return a set of names of vectors of a certain NodeType.
         """
-        vecs = set()
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == node_type and\
-               node.index is not None:
-                vecs.add(name.split("[")[0])
-        return vecs
+        return frozenset(self._vec_names[node_type])
 
     def get_scalar_names(self, node_type):
-        vecs = self.get_vector_names(node_type)
+        vecs = self._vec_names[node_type]
         scalars = set()
-        for name in self.nodes:
-            node = self.nodes[name]
-            if node.node_type == node_type and\
-               node.name.split("[")[0] not in vecs:
+        for node in self._by_type[node_type]:
+            if node.name.split("[")[0] not in vecs:
                 scalars.add(node.name)
         return scalars
 
@@ -376,64 +457,65 @@ class Model:
         Load MyModel.h.template
         and fill in the required declarations.
         """
+        parts = []
+
         # Vector knowns
         vecs = self.get_vector_names(NodeType.data)
         vecs = vecs.union(self.get_vector_names(NodeType.prior_info))
-        declarations = "        // Data and prior information\n"
+        parts.append("        // Data and prior information\n")
         for vec in vecs:
-            declarations += "        static const std::vector"
+            parts.append("        static const std::vector")
             if self.nodes[vec + "[0]"].dtype == int:
-                declarations += "<int>"
+                parts.append("<int>")
             else:
-                declarations += "<double>"
-            declarations += " {x};\n".format(x=vec)
+                parts.append("<double>")
+            parts.append(" {x};\n".format(x=vec))
 
         # Scalar knowns
         scalars = self.get_scalar_names(NodeType.data)
         scalars = scalars.union(self.get_scalar_names(NodeType.prior_info))
         for scalar in scalars:
-            declarations += "        static const "
+            parts.append("        static const ")
             if self.nodes[scalar].dtype == int:
-                declarations += "int"
+                parts.append("int")
             else:
-                declarations += "double"
-            declarations += " {x};\n".format(x=scalar)
+                parts.append("double")
+            parts.append(" {x};\n".format(x=scalar))
 
-        declarations += \
-                "\n        // Unknown parameters and derived quantities\n"
+        parts.append(
+                "\n        // Unknown parameters and derived quantities\n")
 
         # Vector unknowns
         vecs = self.get_vector_names(NodeType.coordinate)
         vecs = vecs.union(self.get_vector_names(NodeType.derived))
         for vec in vecs:
-            declarations += "        std::vector"
+            parts.append("        std::vector")
             if self.nodes[vec + "[0]"].dtype == int:
-                declarations += "<int>"
+                parts.append("<int>")
             else:
-                declarations += "<double>"
-            declarations += " {x};\n".format(x=vec)
+                parts.append("<double>")
+            parts.append(" {x};\n".format(x=vec))
 
         # Scalar unknowns
         scalars = self.get_scalar_names(NodeType.coordinate)
         scalars = scalars.union(self.get_scalar_names(NodeType.derived))
         for scalar in scalars:
-            declarations += "        "
+            parts.append("        ")
             if self.nodes[scalar].dtype == int:
-                declarations += "int"
+                parts.append("int")
             else:
-                declarations += "double"
-            declarations += " {x};\n".format(x=scalar)
+                parts.append("double")
+            parts.append(" {x};\n".format(x=scalar))
+
+        declarations = "".join(parts)
 
-         # Open the template .h file
-        f = open("MyModel.h.template")
-        s = f.read()
-        s = s.replace("        {DECLARATIONS}", declarations)
-        f.close()
+        # Fill in the template .h file
+        s = _load_template("MyModel.h.template")\
+                .substitute(DECLARATIONS=declarations)
 
         # Write the new .h file
-        f = open("MyModel.h", "w")
-        f.write(s)
-        f.close()
+        with open("MyModel.h", "w") as f:
+            f.write(s)
 
         return s
 
@@ -443,30 +525,12 @@ class Model:
         Load MyModel.cpp.template
         and fill in the required stuff.
         """
-        # Prepare the from_prior code
-        from_prior = self.from_prior()
-        from_prior = ["    " + x for x in from_prior.splitlines()]
-        from_prior = "\n".join(from_prior)
-
-        # Prepare the perturb code
-        perturb = self.perturb()
-        perturb = ["    " + x for x in perturb.splitlines()]
-        perturb = "\n".join(perturb)
-
-        # Prepare the log_likelihood code
-        log_likelihood = self.log_likelihood()
-        log_likelihood = ["    " + x for x in log_likelihood.splitlines()]
-        log_likelihood = "\n".join(log_likelihood)
-
-        # Prepare the print code
-        print_code = self.print_code()
-        print_code = ["    " + x for x in print_code.splitlines()]
-        print_code = "\n".join(print_code)
-
-        # Prepare the description code
-        description = self.description()
-        description = ["    " + x for x in description.splitlines()]
-        description = "\n".join(description)
+        # Prepare the code blocks, indented one level
+        from_prior = indent(self.from_prior(), "    ").rstrip("\n")
+        perturb = indent(self.perturb(), "    ").rstrip("\n")
+        log_likelihood = indent(self.log_likelihood(), "    ").rstrip("\n")
+        print_code = indent(self.print_code(), "    ").rstrip("\n")
+        description = indent(self.description(), "    ").rstrip("\n")
 
         # Prepare the data
         the_data = ""
@@ -503,24 +567,19 @@ class Model:
             initialiser_list += str(self.get_vector_size(vec)) + "), "
         initialiser_list = initialiser_list[0:-2]
 
-        # Open the template .cpp file
-        f = open("MyModel.cpp.template")
-        s = f.read()
-
-        # Do the replacements
-        s = s.replace("{FROM_PRIOR}", from_prior)
-        s = s.replace("{PERTURB}", perturb)
-        s = s.replace("{LOG_LIKELIHOOD}", log_likelihood)
-        s = s.replace("{PRINT}", print_code)
-        s = s.replace("{DESCRIPTION}", description)
-        s = s.replace("{STATIC_DECLARATIONS}", the_data)
-        s = s.replace("{INITIALIZER_LIST}", initialiser_list)
-        f.close()
-
-        # Write the new .h file
-        f = open("MyModel.cpp", "w")
-        f.write(s)
-        f.close()
+        # Fill in the template .cpp file
+        s = _load_template("MyModel.cpp.template")\
+                .substitute(FROM_PRIOR=from_prior,
+                            PERTURB=perturb,
+                            LOG_LIKELIHOOD=log_likelihood,
+                            PRINT=print_code,
+                            DESCRIPTION=description,
+                            STATIC_DECLARATIONS=the_data,
+                            INITIALIZER_LIST=initialiser_list)
+
+        # Write the new .cpp file
+        with open("MyModel.cpp", "w") as f:
+            f.write(s)
 
         return s
 
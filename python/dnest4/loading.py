@@ -1,25 +1,84 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-import pandas as pd
+
+try:
+    from ._fastload import parse_row
+except ImportError:
+    parse_row = None
 
 __all__ = ["my_loadtxt", "loadtxt_rows"]
 
 def my_loadtxt(filename, single_precision=False, delimiter=" "):
-    if single_precision:
-        return pd.read_csv(filename, header=None, delimiter=delimiter,\
-                           comment="#", dtype=np.float32)\
+    dtype = np.float32 if single_precision else np.float64
+    try:
+        # ndmin=2 keeps the old pandas shape contract: always 2-D, even
+        # for single-column files like weights.txt
+        return np.loadtxt(filename, comments="#", dtype=dtype, ndmin=2,
+                          delimiter=delimiter if delimiter.strip() else None)
+    except ValueError:
+        # Ragged files (e.g. a partially written final row): fall back
+        # to pandas, which pads short rows with NaN, and drop the
+        # incomplete columns like the old implementation did
+        import pandas as pd
+        return pd.read_csv(filename, header=None, delimiter=delimiter,
+                           comment="#", dtype=dtype)\
                                     .dropna(axis=1).values
-    return pd.read_csv(filename, header=None, delimiter=delimiter, comment="#")\
-                                                 .dropna(axis=1).values
 
 def loadtxt_rows(filename, rows, single_precision=False):
     """
     Load only certain rows
     """
-    # Open the file
-    f = open(filename, "r")
+    rows = set(rows)
+    dtype = np.float32 if single_precision else np.float64
+    try:
+        # pandas parser errors subclass ValueError
+        return _loadtxt_rows_pandas(filename, rows, dtype)
+    except (ImportError, ValueError):
+        return _loadtxt_rows_python(filename, rows, dtype)
+
+def _loadtxt_rows_pandas(filename, rows, dtype):
+    """
+    Fast path for loadtxt_rows. The pandas C parser discards unwanted
+    rows before they ever become Python objects. Assumes comment lines
+    only appear above the data, as in DNest4 output files.
+    """
+    # Imported lazily --- importing pandas is slow, and numpy handles
+    # everything else in this module
+    import pandas as pd
+
+    # Count the comment lines at the top of the file, so that physical
+    # line numbers can be mapped to row numbers.
+    header = 0
+    with open(filename, "r") as f:
+        for line in f:
+            if line.lstrip()[:1] != "#":
+                break
+            header += 1
+
+    # nrows counts kept rows, so parsing stops as soon as the last
+    # requested row has been read
+    df = pd.read_csv(filename, header=None, sep=r"\s+", comment="#",
+                     engine="c", dtype=dtype, nrows=len(rows),
+                     skiprows=lambda i: (i - header) not in rows)
+
+    values = df.values
+
+    # A row with too few columns (e.g. the final line of a file the
+    # sampler is still writing) gets NaN-padded by the parser rather
+    # than raising. Hand it to the row-by-row fallback, which stops at
+    # the incomplete row like the original implementation.
+    if np.isnan(values).any():
+        raise ValueError("Incomplete row in " + filename)
+    results = {row: values[k]
+               for k, row in enumerate(sorted(rows)[:values.shape[0]])}
+    results["ncol"] = df.shape[1]
+    return results
 
+def _loadtxt_rows_python(filename, rows, dtype):
+    """
+    Row-by-row fallback for loadtxt_rows.
+    """
     # Storage
     results = {}
 
@@ -29,29 +88,59 @@ def loadtxt_rows(filename, rows, single_precision=False):
     # Number of columns
     ncol = None
 
-    while(True):
-        # Read the line and split by whitespace
-        line = f.readline()
-        cells = line.split()
+    # Reusable buffer for the compiled parser, with one spare slot so
+    # rows with too many columns are still detected
+    buf = None
+
+    # No need to read past the last requested row
+    stop = max(rows) + 1 if rows else 0
+
+    with open(filename, "r") as f:
+        while(True):
+            line = f.readline()
+
+            # End of file
+            if not line:
+                break
+
+            # Comment lines before the data
+            if ncol is None and line.lstrip()[:1] == "#":
+                continue
+
+            if buf is not None:
+                # Parse with the compiled extension, copying out only
+                # the requested rows
+                if parse_row(line.encode(), buf) != ncol:
+                    break
+                if i in rows:
+                    results[i] = buf[:ncol].astype(dtype)
+                i += 1
+                if i >= stop:
+                    break
+                continue
+
+            # Parse the whole line in one pass
+            values = np.fromstring(line, sep=" ", dtype=dtype)
 
-        # Quit when you see a different number of columns
-        if ncol is not None and len(cells) != ncol:
-            break
+            # Quit when you see a different number of columns
+            # (this also covers the end of the file)
+            if ncol is not None and values.size != ncol:
+                break
 
-        # Non-comment lines
-        if cells[0] != "#":
-            # If it's the first one, get the number of columns
+            # If it's the first row, get the number of columns
             if ncol is None:
-                ncol = len(cells)
+                if values.size == 0:
+                    break
+                ncol = values.size
+                if parse_row is not None:
+                    buf = np.empty(ncol + 1)
 
-            # Otherwise, include in results
+            # Include in results
             if i in rows:
-                if single_precision:
-                    results[i] = np.array([float(cell) for cell in cells],\
-                                                              dtype="float32")
-                else:
-                    results[i] = np.array([float(cell) for cell in cells])
+                results[i] = values
             i += 1
+            if i >= stop:
+                break
 
     results["ncol"] = ncol
     return results
@@ -62,7 +62,15 @@ if __name__ == "__main__":
                                 "-DNO_THREADS"],
             extra_link_args=["-std=c++11"],
         )
-        extensions = cythonize([ext])
+
+        # Fast text parsing for the loading module.
+        fastload = Extension(
+            "dnest4._fastload",
+            sources=[os.path.join("dnest4", "_fastload.pyx")],
+            include_dirs=[numpy.get_include()],
+        )
+
+        extensions = cythonize([ext, fastload])
 
     # Hackishly inject a constant into builtins to enable importing of the
     # package before the library is built.